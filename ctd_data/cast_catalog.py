@@ -0,0 +1,380 @@
+"""
+Catalog of every cast on disk, kept in a small indexed SQLite table so that
+questions like "all Saturday downcasts deeper than 100 dBar" can be answered
+without opening the data files.
+
+Seabird .cnv files carry everything we need in their '*' / '#' header
+(instrument, start time, sample count, interval, pressure span), so they are
+indexed from the header alone. AML files only carry the cast start time in
+their header, so their summary stats are gathered in one streaming pass when
+the file is first indexed; re-running update_catalog() skips files whose size
+and mtime are unchanged.
+"""
+
+import os
+import re
+import csv
+import sqlite3
+import datetime as dt
+
+
+# Catalog & cast paths are anchored here, not to the working directory. Stored
+# fpaths are relative to CTD_DIR
+CTD_DIR = os.path.dirname(os.path.abspath(__file__))
+CATALOG_FPATH = os.path.join(CTD_DIR, 'cast_catalog.db')
+DATA_DIRS = [os.path.join(CTD_DIR, 'AML'), os.path.join(CTD_DIR, 'Seabird')]
+
+# Instrument clocks vs UTC. The AML was set to local Chilean summer time
+# (CLST, UTC-3) while the SBE 25plus runs on UTC - the paired casts start ~3 h
+# apart by their own clocks (noctiluca cast 1 at 16:03 vs SBE 185616).
+# Start times are stored in UTC; weekdays are those of the local field day.
+CLOCK_UTC_OFFSETS = {
+    'AML': dt.timedelta(hours=-3),
+    'SBE': dt.timedelta(0)
+}
+LOCAL_UTC_OFFSET = dt.timedelta(hours=-3)
+
+SCHEMA_VERSION = 2  # bump to rebuild catalogs written by older versions
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS casts (
+    fpath TEXT PRIMARY KEY,
+    mtime REAL,
+    size INTEGER,
+    instrument TEXT,
+    serial TEXT,
+    vessel TEXT,
+    direction TEXT,
+    start_time_utc TEXT,
+    clock_utc_offset_h REAL,
+    weekday TEXT,
+    duration_s REAL,
+    n_samples INTEGER,
+    min_pres REAL,
+    max_pres REAL
+);
+CREATE INDEX IF NOT EXISTS casts_vessel ON casts (vessel);
+CREATE INDEX IF NOT EXISTS casts_instrument ON casts (instrument);
+CREATE INDEX IF NOT EXISTS casts_start_time_utc ON casts (start_time_utc);
+CREATE INDEX IF NOT EXISTS casts_max_pres ON casts (max_pres);
+"""
+
+COLUMNS = ['fpath', 'mtime', 'size', 'instrument', 'serial', 'vessel', 'direction',
+           'start_time_utc', 'clock_utc_offset_h', 'weekday', 'duration_s', 'n_samples',
+           'min_pres', 'max_pres']
+
+
+def parse_cast_fname(fpath):
+    """
+    Vessel & cast direction from names like 'mytilus_friday_cast2_down.csv'.
+    Either is None if the name doesn't follow that convention.
+    """
+    name = os.path.splitext(os.path.basename(fpath))[0].lower()
+    parts = name.split('_')
+
+    vessel = None
+    direction = None
+    if len(parts) >= 3 and parts[2].startswith('cast'):
+        vessel = parts[0]
+    if parts[-1] in ['down', 'up']:
+        direction = parts[-1]
+
+    return vessel, direction
+
+
+def scan_seabird_header(fpath):
+    """
+    Summarise a .cnv cast from its header only - reading stops at '*END*'.
+    """
+    instrument = 'SBE'
+    serial = None
+    n_samples = None
+    interval = None
+    start_time = None
+    pres_col = None
+    spans = {}
+
+    with open(fpath, 'r') as f:
+        for line in f:
+            if line.startswith('*END*'): break
+
+            if line[0] == '*' and serial is None:
+                match = re.search(r"DeviceType='([^']*)' SerialNumber='([^']*)'", line)
+                if match:
+                    instrument, serial = match.group(1), match.group(2)
+
+            elif line[0] == '#':
+                key, _, val = line[1:].partition('=')
+                key = key.strip()
+                val = val.strip()
+
+                if key == 'nvalues':
+                    n_samples = int(val)
+                elif key == 'interval':
+                    interval = float(val.split(':')[1])  # 'seconds: 0.0625'
+                elif key == 'start_time':
+                    start_str = val.split('[')[0].strip()  # 'Jan 14 2023 19:37:49 [...]'
+                    start_time = dt.datetime.strptime(start_str, '%b %d %Y %H:%M:%S')
+                elif key.startswith('name ') and 'Pressure' in val:
+                    pres_col = int(key.split()[1])
+                elif key.startswith('span '):
+                    span_min, span_max = val.split(',')
+                    spans[int(key.split()[1])] = (float(span_min), float(span_max))
+
+    min_pres, max_pres = spans.get(pres_col, (None, None))
+    duration_s = None
+    if n_samples is not None and interval is not None:
+        duration_s = n_samples * interval
+
+    return {
+        'instrument': instrument,
+        'serial': serial,
+        'start_time': start_time,
+        'duration_s': duration_s,
+        'n_samples': n_samples,
+        'min_pres': min_pres,
+        'max_pres': max_pres
+    }
+
+
+def scan_aml_csv(fpath):
+    """
+    Summarise an AML cast - either a raw export (date=/time= header lines,
+    then '[data]') or one of the isolated down/up casts written by
+    isolate_casts.py (single 'Datetime,Pressure,...' header row).
+    """
+    cast_datestr = ''
+    cast_timestr = ''
+    pres_idx = None
+    time_idx = None
+    first_time = None
+    last_time = None
+    n_samples = 0
+    min_pres = None
+    max_pres = None
+
+    with open(fpath, newline='') as f:
+        reader = csv.reader(f)
+
+        read_headings = False
+        data_start = False
+        for row in reader:
+            if not row: continue
+
+            if not data_start and not read_headings:
+                if row[0] == '[data]':
+                    # Next row will contain header
+                    read_headings = True
+                elif row[0].split('=')[0] == 'date':
+                    cast_datestr = row[0].split('=')[1]  # yyyy-mm-dd
+                elif row[0].split('=')[0] == 'time':
+                    cast_timestr = row[0].split('=')[1]  # HH:MM:SS.ms
+                elif row[0] == 'Datetime':
+                    # Isolated cast - header is the first row
+                    time_idx = 0
+                    pres_idx = row.index('Pressure')
+                    data_start = True
+
+            elif read_headings:
+                time_idx = row.index('Time')
+                pres_idx = row.index('Pressure (dBar)')
+                read_headings = False
+                data_start = True
+
+            elif data_start:
+                p = float(row[pres_idx])
+                min_pres = p if min_pres is None else min(min_pres, p)
+                max_pres = p if max_pres is None else max(max_pres, p)
+                n_samples += 1
+
+                if first_time is None: first_time = row[time_idx]
+                last_time = row[time_idx]
+
+    start_time = None
+    duration_s = None
+    if cast_datestr:
+        # Raw export - sample times are MM:SS.d within the header's hour
+        cast_datetime_str = cast_datestr + ':' + cast_timestr[:-3]  # ignore deci-second
+        start_time = dt.datetime.strptime(cast_datetime_str, '%Y-%m-%d:%H:%M:%S')
+        if first_time is not None:
+            first_s = int(first_time.split(':')[0]) * 60 + float(first_time.split(':')[1])
+            last_s = int(last_time.split(':')[0]) * 60 + float(last_time.split(':')[1])
+            duration_s = (last_s - first_s) % 3600
+    elif first_time is not None:
+        start_time = dt.datetime.fromisoformat(first_time)
+        duration_s = (dt.datetime.fromisoformat(last_time) - start_time).total_seconds()
+
+    return {
+        'instrument': 'AML',
+        'serial': None,
+        'start_time': start_time,
+        'duration_s': duration_s,
+        'n_samples': n_samples,
+        'min_pres': min_pres,
+        'max_pres': max_pres
+    }
+
+
+def scan_cast(fpath):
+    if fpath.lower().endswith('.cnv'):
+        summary = scan_seabird_header(fpath)
+    else:
+        summary = scan_aml_csv(fpath)
+
+    vessel, direction = parse_cast_fname(fpath)
+    summary['vessel'] = vessel
+    summary['direction'] = direction
+    return summary
+
+
+def open_catalog(catalog_fpath=CATALOG_FPATH):
+    conn = sqlite3.connect(catalog_fpath)
+    conn.row_factory = sqlite3.Row
+
+    # The catalog is only a cache of the files on disk, so an outdated one is rebuilt
+    if conn.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+        conn.execute('DROP TABLE IF EXISTS casts')
+        conn.execute('PRAGMA user_version = {}'.format(SCHEMA_VERSION))
+
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def catalog_key(fpath):
+    # Same key for a file whatever the working directory
+    return os.path.relpath(os.path.abspath(fpath), CTD_DIR)
+
+
+def in_dir(key, data_dir):
+    fpath = os.path.abspath(os.path.join(CTD_DIR, key))
+    data_dir = os.path.abspath(data_dir)
+    return os.path.commonpath([fpath, data_dir]) == data_dir
+
+
+def clock_utc_offset(instrument):
+    for clock, offset in CLOCK_UTC_OFFSETS.items():
+        if instrument.startswith(clock): return offset
+    raise ValueError('No clock offset known for instrument {}'.format(instrument))
+
+
+def to_utc(t):
+    """Aware datetimes are converted; naive datetimes & dates are local field time"""
+    if not isinstance(t, dt.datetime):
+        t = dt.datetime(t.year, t.month, t.day)
+    if t.tzinfo is not None:
+        return t.astimezone(dt.timezone.utc).replace(tzinfo=None)
+    return t - LOCAL_UTC_OFFSET
+
+
+def update_catalog(conn, data_dirs=DATA_DIRS):
+    """
+    Index any new or modified cast files under data_dirs and drop entries for
+    files under data_dirs that no longer exist - entries outside the scanned
+    dirs are left alone. Relative data_dirs are taken from the working
+    directory. Returns the list of (re)indexed catalog keys (paths relative
+    to CTD_DIR).
+    """
+    known = {row['fpath']: (row['mtime'], row['size'])
+             for row in conn.execute('SELECT fpath, mtime, size FROM casts')}
+
+    seen = set()
+    indexed = []
+    for data_dir in data_dirs:
+        for root, _, fnames in os.walk(data_dir):
+            for fname in sorted(fnames):
+                if not fname.lower().endswith(('.csv', '.cnv')): continue
+
+                fpath = os.path.join(root, fname)
+                key = catalog_key(fpath)
+                stat = os.stat(fpath)
+                seen.add(key)
+                if known.get(key) == (stat.st_mtime, stat.st_size): continue
+
+                summary = scan_cast(fpath)
+                clock_offset = clock_utc_offset(summary['instrument'])
+                start_time_utc = None
+                weekday = None
+                if summary['start_time'] is not None:
+                    start_time_utc = summary['start_time'] - clock_offset
+                    weekday = (start_time_utc + LOCAL_UTC_OFFSET).strftime('%A').lower()
+
+                row = dict(summary,
+                    fpath=key,
+                    mtime=stat.st_mtime,
+                    size=stat.st_size,
+                    start_time_utc=start_time_utc.isoformat() if start_time_utc else None,
+                    clock_utc_offset_h=clock_offset.total_seconds() / 3600,
+                    weekday=weekday)
+
+                conn.execute(
+                    'INSERT OR REPLACE INTO casts ({}) VALUES ({})'.format(
+                        ', '.join(COLUMNS), ', '.join('?' * len(COLUMNS))),
+                    [row[col] for col in COLUMNS])
+                indexed.append(key)
+
+    for key in set(known) - seen:
+        if not any(in_dir(key, data_dir) for data_dir in data_dirs): continue
+        conn.execute('DELETE FROM casts WHERE fpath = ?', (key,))
+
+    conn.commit()
+    return indexed
+
+
+def query_casts(conn, vessel=None, instrument=None, direction=None, weekday=None,
+                start=None, end=None, deeper_than=None, shallower_than=None):
+    """
+    Return catalog rows (as dicts) matching every given filter.
+    start & end - datetime / date objects bounding the cast start time, see
+        to_utc() for how they are read
+    weekday - day of the week in local field time
+    deeper_than & shallower_than - bounds on the cast's max pressure (dBar)
+    """
+    clauses = []
+    params = []
+
+    if vessel is not None:
+        clauses.append('vessel = ?')
+        params.append(vessel.lower())
+    if instrument is not None:
+        clauses.append('instrument LIKE ?')
+        params.append(instrument + '%')
+    if direction is not None:
+        clauses.append('direction = ?')
+        params.append(direction)
+    if weekday is not None:
+        clauses.append('weekday = ?')
+        params.append(weekday.lower())
+    if start is not None:
+        clauses.append('start_time_utc >= ?')
+        params.append(to_utc(start).isoformat())
+    if end is not None:
+        clauses.append('start_time_utc < ?')
+        params.append(to_utc(end).isoformat())
+    if deeper_than is not None:
+        clauses.append('max_pres > ?')
+        params.append(deeper_than)
+    if shallower_than is not None:
+        clauses.append('max_pres < ?')
+        params.append(shallower_than)
+
+    sql = 'SELECT * FROM casts'
+    if clauses:
+        sql += ' WHERE ' + ' AND '.join(clauses)
+    sql += ' ORDER BY start_time_utc'
+
+    return [dict(row) for row in conn.execute(sql, params)]
+
+
+def main():
+    conn = open_catalog()
+    indexed = update_catalog(conn)
+    print("Indexed {} new/modified casts".format(len(indexed)))
+
+    casts = query_casts(conn, weekday='saturday', direction='down', deeper_than=100)
+    for cast in casts:
+        print("{fpath}: {start_time_utc} UTC, {n_samples} samples, max {max_pres} dBar".format(**cast))
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
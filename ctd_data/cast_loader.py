@@ -0,0 +1,142 @@
+"""
+Prefetching loader for processing many casts in a row.
+
+A background thread reads the raw bytes of upcoming files into a bounded
+queue while the main thread parses & bins the current one, so disk reads
+overlap with computation. Parsers get the prefetched buffer wrapped in a
+BytesIO (which shares the bytes object rather than copying it) instead of a
+path, and see it as an ordinary open file.
+"""
+
+import io
+import os
+import glob
+import time
+import queue
+import threading
+
+from interactive_plot import read_seabird, parse_isolated_csv, bin_by_pres
+
+
+MAX_PREFETCH = 4  # files held in memory ahead of the parser
+
+
+def new_loader_stats():
+    return {
+        'n_files': 0,
+        'n_bytes': 0,
+        'read_s': 0.0,  # time the background thread spent reading
+        'io_wait_s': 0.0,  # time the main thread sat waiting for a buffer
+        'compute_s': 0.0  # time the main thread spent parsing / processing
+    }
+
+
+def _put(buffers, item, stop):
+    # Bounded put that gives up if the consumer has stopped iterating
+    while not stop.is_set():
+        try:
+            buffers.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _read_ahead(fpaths, buffers, stop, stats):
+    try:
+        for fpath in fpaths:
+            t_start = time.perf_counter()
+            with open(fpath, 'rb') as f:
+                buf = f.read()
+            stats['read_s'] += time.perf_counter() - t_start
+            stats['n_bytes'] += len(buf)
+
+            if not _put(buffers, (fpath, buf), stop): return
+    except Exception as e:
+        _put(buffers, (None, e), stop)
+        return
+
+    _put(buffers, (None, None), stop)
+
+
+def open_buffer(fpath, buf):
+    # csv wants newline='' - Seabird lines are fine with universal newlines
+    newline = '' if fpath.lower().endswith('.csv') else None
+    return io.TextIOWrapper(io.BytesIO(buf), newline=newline)
+
+
+def prefetch_casts(fpaths, parse_fn, stats=None, max_prefetch=MAX_PREFETCH):
+    """
+    Yield (fpath, parse_fn(file)) for each file in fpaths, reading ahead on a
+    background thread.
+    parse_fn - takes an open text file, e.g. read_seabird, parse_ctd_csv or
+        parse_isolated_csv
+    stats - optional dict from new_loader_stats(), updated in place. Time the
+        caller spends between iterations counts as compute.
+    """
+    if stats is None: stats = new_loader_stats()
+
+    buffers = queue.Queue(maxsize=max_prefetch)
+    stop = threading.Event()
+    reader = threading.Thread(
+        target=_read_ahead, args=(list(fpaths), buffers, stop, stats), daemon=True)
+    reader.start()
+
+    try:
+        while True:
+            t_wait = time.perf_counter()
+            fpath, buf = buffers.get()
+            t_compute = time.perf_counter()
+            stats['io_wait_s'] += t_compute - t_wait
+
+            if fpath is None:
+                if buf is not None: raise buf
+                break
+
+            with open_buffer(fpath, buf) as f:
+                data = parse_fn(f)
+            stats['n_files'] += 1
+
+            yield fpath, data
+            stats['compute_s'] += time.perf_counter() - t_compute
+    finally:
+        stop.set()
+        reader.join()
+
+
+def print_loader_stats(name, stats):
+    print("{}: {} files ({:.1f} MB)".format(name, stats['n_files'], stats['n_bytes'] / 1e6))
+    print("    I/O wait: {:.3f} s, compute: {:.3f} s (background reads: {:.3f} s)".format(
+        stats['io_wait_s'], stats['compute_s'], stats['read_s']))
+
+
+def main():
+    binned = {}
+
+    # Seabird
+    seabird_fpaths = sorted(glob.glob(os.path.join('Seabird', '*.cnv')))
+    sb_stats = new_loader_stats()
+    for fpath, sb_data in prefetch_casts(seabird_fpaths,
+            lambda f: read_seabird(f, pres_thresh=1), stats=sb_stats):
+        binned[fpath] = {
+            'pres': bin_by_pres(sb_data['pres']),
+            'temps': bin_by_pres(sb_data['pres'], sb_data['temps'])
+        }
+
+    # AML (isolated down/up casts)
+    aml_fpaths = sorted(glob.glob(os.path.join('AML', '*.csv')))
+    aml_stats = new_loader_stats()
+    for fpath, aml_data in prefetch_casts(aml_fpaths,
+            lambda f: parse_isolated_csv(f, pres_thresh=1), stats=aml_stats):
+        binned[fpath] = {
+            'pres': bin_by_pres(aml_data['pres']),
+            'temps': bin_by_pres(aml_data['pres'], aml_data['temps']),
+            'corr_oxys': bin_by_pres(aml_data['pres'], aml_data['corr_oxys'])
+        }
+
+    print_loader_stats("Seabird", sb_stats)
+    print_loader_stats("AML", aml_stats)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ from sklearn.linear_model import LinearRegression
 
 import re
 import csv
+import contextlib
 import datetime as dt
 
 
@@ -35,6 +36,12 @@ def Aanderaa_O2_compensation(meas_o2, temp, pres, sal, ref_sal=0):
 def PSU_to_ref_sal(psu): return psu * (35.16504/35)
 
 
+def open_cast(cast_file, **kwargs):
+    # Accept either a path or an already-open file (e.g. a buffer from cast_loader)
+    if hasattr(cast_file, 'read'): return contextlib.nullcontext(cast_file)
+    return open(cast_file, **kwargs)
+
+
 def read_seabird(fname, pres_thresh=0.5):
     pres = []  # 0
     temps = []  # 1
@@ -43,9 +50,8 @@ def read_seabird(fname, pres_thresh=0.5):
     sals = []  # 7 (absolute salinity)
     dens = []  # 8
 
-    with open(fname, 'r') as f:
-        lines = f.readlines()
-        for l_i, line in enumerate(lines):
+    with open_cast(fname, mode='r') as f:
+        for line in f:
             if line[0] in ['*', '#']: continue
 
             line = re.sub('\s+', ',', line)[1:-1]
@@ -98,7 +104,7 @@ def parse_ctd_csv(cast_fpath, pres_thresh=0.5):
     sal_idx = None
     oxy_idx = None
 
-    with open(cast_fpath, newline='') as f:
+    with open_cast(cast_fpath, newline='') as f:
         reader = csv.reader(f)
 
         read_headings = False
@@ -174,6 +180,49 @@ def parse_ctd_csv(cast_fpath, pres_thresh=0.5):
         'turbs': turbs
     }
 
+
+def parse_isolated_csv(cast_fpath, pres_thresh=0.5):
+    """
+    Read a single down/up cast written by isolate_casts.py
+    (Datetime,Pressure,Temperature,Salinity,Oxygen,Turbidity). Returns the
+    same keys as parse_ctd_csv, minus 'dens' which isn't kept in these files.
+    """
+    datetimes = []
+    pres = []
+    temps = []
+    sals = []
+    oxys = []
+    corr_oxys = []
+    turbs = []
+
+    with open_cast(cast_fpath, newline='') as f:
+        for row in csv.DictReader(f):
+            p = float(row['Pressure'])
+            if p < pres_thresh: continue
+
+            temp = float(row['Temperature'])
+            sal = PSU_to_ref_sal(float(row['Salinity']))
+            oxy = float(row['Oxygen'])
+
+            datetimes.append(dt.datetime.fromisoformat(row['Datetime']))
+            pres.append(p)
+            temps.append(temp)
+            sals.append(sal)
+            oxys.append(oxy)
+            turbs.append(float(row['Turbidity']))
+            corr_oxys.append(Aanderaa_O2_compensation(oxy, temp, p, sal, ref_sal=0))
+
+    return {
+        'dts': datetimes,
+        'pres': pres,
+        'temps': temps,
+        'sals': sals,
+        'oxys': oxys,
+        'corr_oxys': corr_oxys,
+        'turbs': turbs
+    }
+
+
 def separate_casts_seabird(down_stop_idx, up_start_idx, sb_data):
     """
     down_stop_idx & up_start_idx - sample indices
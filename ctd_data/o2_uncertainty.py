@@ -0,0 +1,159 @@
+"""
+Monte-Carlo uncertainty for binned, compensated AML O2 profiles.
+
+Each realization perturbs temperature, salinity, pressure and raw O2, then
+runs the perturbed cast through Aanderaa_O2_compensation and the same 0.5 dBar
+binning as bin_by_pres. Realizations are processed as (realizations x samples)
+arrays, CHUNK_SIZE realizations at a time to bound memory.
+
+Sensor accuracy is applied as one offset per realization (a calibration bias
+is shared by the whole cast), sensor precision as independent per-sample
+noise. Both are treated as 1-sigma. Values are from the AML X2change
+CT.X / Xchange P and Aanderaa 4831 spec sheets.
+"""
+
+import warnings
+import numpy as np
+import matplotlib.pyplot as plt
+
+from interactive_plot import Aanderaa_O2_compensation, parse_isolated_csv, bin_by_pres
+
+
+SENSOR_ACCURACY = {
+    'temps': 0.005,  # deg C
+    'sals': 0.01,  # PSU
+    'pres': 0.25,  # dBar (0.05% of 500 dBar full scale)
+    'oxys': 8.0,  # umol/L, or...
+    'oxys_rel': 0.05  # ...5% of reading, whichever is greater
+}
+SENSOR_PRECISION = {
+    'temps': 0.001,
+    'sals': 0.005,
+    'pres': 0.01,
+    'oxys': 1.0
+}
+BIN_SIZE = 0.5  # dBar, matches bin_by_pres
+CHUNK_SIZE = 256
+RNG_BLOCK = 64  # realizations drawn per spawned generator - fixed so results don't depend on chunk_size
+
+
+def bin_by_pres_batched(pres, vals, pres_bins):
+    """
+    Vectorised bin_by_pres over a batch of realizations.
+    pres & vals - (realizations x samples) arrays
+    pres_bins - bins returned by bin_by_pres(pres) for the unperturbed cast
+    Returns a (realizations x bins) array, NaN where a bin has no samples.
+    Samples perturbed outside the range bin_by_pres covers (first bin edge to
+    ceil(max) inclusive) are dropped rather than piled into the edge bins.
+    """
+    n_real = pres.shape[0]
+    n_bins = pres_bins.size
+
+    # Same bin as bin_by_pres: the last bin edge at or below each sample, with
+    # samples at exactly ceil(max) going into the last bin
+    top = pres_bins[-1] + BIN_SIZE
+    in_range = ((pres >= pres_bins[0]) & (pres <= top)).ravel()
+    bin_idx = np.floor((pres - pres_bins[0]) / BIN_SIZE).astype(int)
+    bin_idx = np.minimum(bin_idx, n_bins - 1)
+
+    # Offset each realization into its own block of bins so one bincount does the lot
+    flat_idx = (bin_idx + n_bins * np.arange(n_real)[:, None]).ravel()[in_range]
+    val_sums = np.bincount(flat_idx, weights=vals.ravel()[in_range], minlength=n_real * n_bins)
+    val_counts = np.bincount(flat_idx, minlength=n_real * n_bins)
+
+    binned_vals = val_sums / np.maximum(val_counts, 1)
+    binned_vals[val_counts == 0] = np.nan
+
+    return binned_vals.reshape(n_real, n_bins)
+
+
+def mc_o2_bands(cast, n_real=5000, ci=0.95, ref_sal=0, chunk_size=CHUNK_SIZE,
+                accuracy=SENSOR_ACCURACY, precision=SENSOR_PRECISION, seed=None):
+    """
+    Per-bin confidence bands on compensated O2 for a single (down or up) cast.
+    cast - dict with 'pres', 'temps', 'sals' & 'oxys', e.g. from separate_casts_aml
+    ci - width of the central confidence band, e.g. 0.95 for 2.5th-97.5th percentiles
+    Realizations are drawn in fixed RNG_BLOCK blocks, each from its own
+    generator spawned from seed, so results don't depend on chunk_size (which
+    is rounded to whole blocks). Bands are NaN where the unperturbed cast has
+    no samples.
+    """
+    pres = np.asarray(cast['pres'], dtype=float)
+    temps = np.asarray(cast['temps'], dtype=float)
+    sals = np.asarray(cast['sals'], dtype=float)
+    oxys = np.asarray(cast['oxys'], dtype=float)
+    n_samples = pres.size
+
+    pres_bins = bin_by_pres(pres)
+    n_blocks = -(-n_real // RNG_BLOCK)
+    block_seeds = np.random.SeedSequence(seed).spawn(n_blocks)
+    chunk_size = max(RNG_BLOCK, chunk_size - chunk_size % RNG_BLOCK)
+
+    corr_oxys = Aanderaa_O2_compensation(oxys, temps, pres, sals, ref_sal=ref_sal)
+    nominal = bin_by_pres_batched(pres[None, :], corr_oxys[None, :], pres_bins)[0]
+
+    o2_acc = np.maximum(accuracy['oxys'], accuracy['oxys_rel'] * oxys)
+
+    binned = np.empty((n_real, pres_bins.size))
+    for start in range(0, n_real, chunk_size):
+        n_chunk = min(chunk_size, n_real - start)
+
+        # Per variable (p, t, s, o2): column 0 is the realization's bias, the rest per-sample noise
+        first_block = start // RNG_BLOCK
+        last_block = (start + n_chunk - 1) // RNG_BLOCK
+        z = np.concatenate([
+            np.random.default_rng(block_seeds[b]).standard_normal(
+                (4, min(RNG_BLOCK, n_real - b * RNG_BLOCK), n_samples + 1))
+            for b in range(first_block, last_block + 1)], axis=1)
+
+        p = pres + accuracy['pres'] * z[0, :, :1] + precision['pres'] * z[0, :, 1:]
+        t = temps + accuracy['temps'] * z[1, :, :1] + precision['temps'] * z[1, :, 1:]
+        s = sals + accuracy['sals'] * z[2, :, :1] + precision['sals'] * z[2, :, 1:]
+        o2 = oxys + o2_acc * z[3, :, :1] + precision['oxys'] * z[3, :, 1:]
+
+        mc_corr_oxys = Aanderaa_O2_compensation(o2, t, p, s, ref_sal=ref_sal)
+        binned[start:start + n_chunk] = bin_by_pres_batched(p, mc_corr_oxys, pres_bins)
+
+    with warnings.catch_warnings():
+        # Bins that are empty in every realization stay NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        lower, median, upper = np.nanpercentile(
+            binned, [50 * (1 - ci), 50, 50 * (1 + ci)], axis=0)
+
+    no_data = np.isnan(nominal)
+    lower[no_data] = np.nan
+    median[no_data] = np.nan
+    upper[no_data] = np.nan
+
+    return {
+        'pres': pres_bins,
+        'corr_oxys': nominal,
+        'median': median,
+        'lower': lower,
+        'upper': upper
+    }
+
+
+def main():
+    # Read AML data (already isolated downcast)
+    aml_down1_fp = 'AML/noctiluca_saturday_cast1_down.csv'
+    aml_down1 = parse_isolated_csv(aml_down1_fp, pres_thresh=1)
+
+    bands = mc_o2_bands(aml_down1, n_real=5000, ci=0.95, seed=0)
+
+    fig, ax = plt.subplots(1, figsize=(5, 8))
+    ax.fill_betweenx(bands['pres'], bands['lower'], bands['upper'],
+        alpha=0.3, label='95% interval')
+    ax.plot(bands['corr_oxys'], bands['pres'], 'k', linewidth=0.8, label='AML (corrected)')
+    ax.legend(loc=4)
+    ax.invert_yaxis()
+    ax.grid(alpha=0.5)
+    ax.set_title("O$_2$ Concentration ($\mu$mol/L)")
+    ax.set_ylabel("Pressure (dBar)")
+
+    fig.tight_layout()
+    plt.show()
+
+
+if __name__ == "__main__":
+    main()
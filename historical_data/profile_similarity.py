@@ -0,0 +1,292 @@
+"""
+k-nearest-neighbour search between historical WOD / Hudson profiles and our
+modern casts.
+
+Every profile is put on PRES_GRID as one fixed-length (T, S, O2) feature
+vector, and all vectors live in a single contiguous float32 matrix with a
+matching validity mask, so missing depths (short casts, MBT profiles with no
+S or O2) simply drop out of the distance. Distances are computed for all
+archive profiles at once with three matrix products per block of rows.
+
+Units are harmonised before gridding: salinity as practical salinity, O2 in
+umol/L, and WOD depths (m) are used as dBar (< 1% error over fjord depths).
+"""
+
+import os
+import sys
+import csv
+import glob
+import numpy as np
+
+from wod_rd import wod_rd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ctd_data'))
+from interactive_plot import parse_isolated_csv, read_seabird
+
+
+PRES_GRID = np.arange(0, 300.1, 5)  # dBar
+VARS = ['temps', 'sals', 'oxys']
+O2_ML_L_TO_UMOL_L = 44.661
+# WOD stored dissolved O2 in ml/l up to WOD13 and in umol/kg from WOD18 on.
+# Both releases use the 'C' native format, so the unit can't be read from the file
+WOD_O2_UNITS = ['ml/l', 'umol/kg']
+DEFAULT_DENSITY = 1025.0  # kg/m^3, where T or S is missing for the umol/kg conversion
+MIN_OVERLAP = 5  # grid levels a candidate must share with the query
+CHUNK_ROWS = 4096  # archive rows per float64 distance block
+
+
+def grid_profile(pres, vals, grid=PRES_GRID):
+    """
+    Average vals into grid cells centred on each grid pressure, then fill
+    empty cells inside the sampled range by linear interpolation (for bottle
+    data). NaN outside the sampled range.
+    """
+    pres = np.asarray(pres, dtype=float)
+    vals = np.asarray(vals, dtype=float)
+    ok = np.isfinite(pres) & np.isfinite(vals)
+    pres = pres[ok]
+    vals = vals[ok]
+
+    gridded = np.full(grid.size, np.nan)
+    if pres.size == 0: return gridded
+
+    step = grid[1] - grid[0]
+    cell_idx = np.round((pres - grid[0]) / step).astype(int)
+    in_grid = (cell_idx >= 0) & (cell_idx < grid.size)
+    val_sums = np.bincount(cell_idx[in_grid], weights=vals[in_grid], minlength=grid.size)
+    val_counts = np.bincount(cell_idx[in_grid], minlength=grid.size)
+    filled = val_counts > 0
+    gridded[filled] = val_sums[filled] / val_counts[filled]
+
+    gaps = ~filled & (grid >= pres.min()) & (grid <= pres.max())
+    if gaps.any() and filled.sum() > 1:
+        gridded[gaps] = np.interp(grid[gaps], grid[filled], gridded[filled])
+
+    return gridded
+
+
+def profile_vector(profile, grid=PRES_GRID):
+    """Concatenated gridded (T, S, O2) vector - NaN where a variable is missing"""
+    return np.concatenate([
+        grid_profile(profile['pres'], profile[var], grid) if var in profile
+        else np.full(grid.size, np.nan)
+        for var in VARS])
+
+
+def surface_density(temp, sal):
+    """
+    EOS-80 one-atmosphere seawater density (kg/m^3) from in-situ temperature
+    (deg C) & practical salinity - close enough to convert O2 per kg to per L.
+    """
+    T = np.asarray(temp, dtype=float)
+    S = np.asarray(sal, dtype=float)
+
+    rho_w = (999.842594 + 6.793952e-2*T - 9.095290e-3*T**2 + 1.001685e-4*T**3
+             - 1.120083e-6*T**4 + 6.536332e-9*T**5)
+    A = 8.24493e-1 - 4.0899e-3*T + 7.6438e-5*T**2 - 8.2467e-7*T**3 + 5.3875e-9*T**4
+    B = -5.72466e-3 + 1.0227e-4*T - 1.6546e-6*T**2
+    C = 4.8314e-4
+
+    return rho_w + A*S + B*S**1.5 + C*S**2
+
+
+def wod_profiles(fname, o2_units='umol/kg'):
+    """
+    Profiles from a WOD file with O2 converted to umol/L.
+    o2_units - units of the file's 'ox' variable: 'umol/kg' for WOD18 and
+        later exports, 'ml/l' for WOD13 and earlier
+    """
+    if o2_units not in WOD_O2_UNITS:
+        raise ValueError('o2_units must be one of {}, not {}'.format(WOD_O2_UNITS, o2_units))
+
+    profiles = []
+    for p in wod_rd(fname):
+        profile = {
+            'source': os.path.basename(fname),
+            'label': '{} stn {} ({:.2f}, {:.2f})'.format(
+                p['time'].date(), p['station'], p['latitude'], p['longitude']),
+            'pres': p['depth']
+        }
+        if 'temp' in p: profile['temps'] = p['temp']
+        if 'sal' in p: profile['sals'] = p['sal']
+        if 'ox' in p:
+            if o2_units == 'ml/l':
+                profile['oxys'] = p['ox'] * O2_ML_L_TO_UMOL_L
+            else:
+                dens = np.full(p['ox'].shape, DEFAULT_DENSITY)
+                if 'temp' in p and 'sal' in p:
+                    dens = surface_density(p['temp'], p['sal'])
+                    dens = np.where(np.isfinite(dens), dens, DEFAULT_DENSITY)
+                profile['oxys'] = p['ox'] * dens / 1000  # umol/kg -> umol/L
+        profiles.append(profile)
+
+    return profiles
+
+
+def hudson_profile(fname='./Hudson_findings/comau_measurements.csv'):
+    depths, temps, sals, oxys = [], [], [], []
+    with open(fname, newline='') as f:
+        for row in csv.DictReader(f):
+            depths.append(float(row['depth']))
+            temps.append(float(row['temp']))
+            sals.append(float(row['sal']))
+            oxys.append(float(row['o2']) * O2_ML_L_TO_UMOL_L)
+
+    return {
+        'source': os.path.basename(fname),
+        'label': 'Hudson 1970 Comau mean',
+        'pres': depths,
+        'temps': temps,
+        'sals': sals,
+        'oxys': oxys
+    }
+
+
+def seabird_profile(fname, pres_thresh=1):
+    sb_data = read_seabird(fname, pres_thresh=pres_thresh)
+    sals = np.array(sb_data['sals'])
+    dens = np.array(sb_data['dens'])
+    oxys = np.array(sb_data['oxys'])
+    bad = (oxys < 0) | (sals <= 0)  # -9.990e-29 bad flags
+
+    return {
+        'source': os.path.basename(fname),
+        'label': os.path.basename(fname).split(' ')[0],
+        'pres': sb_data['pres'],
+        'temps': sb_data['temps'],
+        'sals': np.where(bad, np.nan, sals * (35 / 35.16504)),  # absolute -> practical
+        'oxys': np.where(bad, np.nan, oxys * dens / 1000)  # umol/kg -> umol/L
+    }
+
+
+def aml_profile(fname):
+    """An isolated AML cast (Datetime,Pressure,Temperature,... from isolate_casts.py)"""
+    aml_data = parse_isolated_csv(fname)
+
+    return {
+        'source': os.path.basename(fname),
+        'label': os.path.splitext(os.path.basename(fname))[0],
+        'pres': aml_data['pres'],
+        'temps': aml_data['temps'],
+        'sals': np.array(aml_data['sals']) * (35 / 35.16504),  # reference -> practical
+        'oxys': aml_data['corr_oxys']
+    }
+
+
+def normalise(vectors, centres, scales, n_levels):
+    # Per-variable centring & scaling keeps values O(1) so float32 distances stay accurate
+    return (vectors - np.repeat(centres, n_levels)) / np.repeat(scales, n_levels)
+
+
+def build_index(profiles, grid=PRES_GRID):
+    """
+    Stack profiles into the search index.
+    Returns a dict with 'features' (n_profiles x 3*n_levels, each variable
+    centred & scaled by its archive mean & spread, NaNs zeroed), 'mask' (1
+    where features are valid), the per-variable 'centres' & 'scales', and the
+    profiles' 'sources' & 'labels'.
+    """
+    features = np.vstack([profile_vector(p, grid) for p in profiles])
+
+    centres = np.zeros(len(VARS))
+    scales = np.ones(len(VARS))
+    for v in range(len(VARS)):
+        var_vals = features[:, v * grid.size:(v + 1) * grid.size]
+        if np.isfinite(var_vals).any():
+            centres[v] = np.nanmean(var_vals)
+            scales[v] = max(np.nanstd(var_vals), 1e-6)
+
+    features = normalise(features, centres, scales, grid.size).astype(np.float32)
+    mask = np.isfinite(features)
+    features[~mask] = 0
+
+    return {
+        'grid': grid,
+        'features': np.ascontiguousarray(features),
+        'mask': np.ascontiguousarray(mask.astype(np.float32)),
+        'centres': centres,
+        'scales': scales,
+        'sources': np.array([p['source'] for p in profiles]),
+        'labels': np.array([p['label'] for p in profiles])
+    }
+
+
+def save_index(index, fname):
+    np.savez(fname, **index)
+
+
+def load_index(fname):
+    with np.load(fname) as f:
+        return {key: f[key] for key in f.files}
+
+
+def knn_query(index, query_profiles, k=5, min_overlap=MIN_OVERLAP):
+    """
+    k nearest archive profiles for each query profile.
+    Distance is the RMS of normalised differences over the (variable, level)
+    values valid in both profiles; candidates sharing fewer than min_overlap
+    grid levels (with at least one common variable) are excluded.
+    Returns (idx, dists) arrays of shape (n_queries x k), nearest first. When
+    fewer than k candidates pass min_overlap the remaining entries are not
+    matches: their idx is -1 and their dist inf.
+    """
+    n_levels = index['grid'].size
+    X = index['features']
+    M = index['mask']
+
+    Q = np.vstack([profile_vector(p, index['grid']) for p in query_profiles])
+    Q = normalise(Q, index['centres'], index['scales'], n_levels).astype(np.float32)
+    QM = np.isfinite(Q).astype(np.float32)
+    Q[QM == 0] = 0
+
+    # sum_j m_ij qm_j (x_ij - q_j)^2 expanded into matrix products; X & Q are zero
+    # where masked so X**2 & Q**2 need no extra mask. Accumulated in float64,
+    # CHUNK_ROWS archive rows at a time, to avoid cancellation in the subtraction
+    Q = Q.astype(np.float64)
+    QM = QM.astype(np.float64)
+    sq_dists = np.empty((X.shape[0], Q.shape[0]))
+    n_values = np.empty((X.shape[0], Q.shape[0]))
+    for start in range(0, X.shape[0], CHUNK_ROWS):
+        X_chunk = X[start:start + CHUNK_ROWS].astype(np.float64)
+        M_chunk = M[start:start + CHUNK_ROWS].astype(np.float64)
+        sq_dists[start:start + CHUNK_ROWS] = (X_chunk**2) @ QM.T - 2 * X_chunk @ Q.T + M_chunk @ (Q**2).T
+        n_values[start:start + CHUNK_ROWS] = M_chunk @ QM.T
+
+    # Levels shared by archive profile & query in at least one variable
+    M3 = M.reshape(M.shape[0], len(VARS), n_levels) > 0
+    QM3 = QM.reshape(QM.shape[0], len(VARS), n_levels) > 0
+    n_levels_shared = np.stack([(M3 & qm).any(axis=1).sum(axis=1) for qm in QM3], axis=1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        dists = np.sqrt(np.maximum(sq_dists, 0) / n_values)
+    dists[n_levels_shared < min_overlap] = np.inf
+    dists = dists.T  # queries x archive
+
+    k = min(k, dists.shape[1])
+    idx = np.argpartition(dists, k - 1, axis=1)[:, :k]
+    idx_dists = np.take_along_axis(dists, idx, axis=1)
+    order = np.argsort(idx_dists, axis=1)
+    idx = np.take_along_axis(idx, order, axis=1)
+    idx_dists = np.take_along_axis(idx_dists, order, axis=1)
+    idx[~np.isfinite(idx_dists)] = -1
+
+    return idx, idx_dists
+
+
+def main():
+    archive = wod_profiles('ocldb1671559124.5072.MBT')
+    archive.append(hudson_profile())
+    index = build_index(archive)
+
+    modern = [aml_profile(fname) for fname in sorted(glob.glob('../ctd_data/AML/*_down.csv'))]
+    modern += [seabird_profile(fname) for fname in sorted(glob.glob('../ctd_data/Seabird/*.cnv'))]
+
+    idx, dists = knn_query(index, modern, k=3)
+    for q, profile in enumerate(modern):
+        print(profile['label'])
+        for i, d in zip(idx[q], dists[q]):
+            if i >= 0: print("    {:.3f}  {}".format(d, index['labels'][i]))
+
+
+if __name__ == "__main__":
+    main()
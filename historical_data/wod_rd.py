@@ -0,0 +1,188 @@
+"""
+Python port of wod_rd.m - reads NODC 'WOD' native ASCII files (WOD01, WOD05
+and WOD13 formats). Only the profile header fields & measured variables are
+kept; PI, biological and taxonomic blocks are parsed and skipped as in the
+MATLAB version.
+"""
+
+import numpy as np
+import datetime as dt
+
+
+# Standard depths (used when a WOD01/05 profile is stored at standard levels)
+STD_DEPTHS = [0., 10., 20., 30., 50., 75., 100., 125., 150.,
+              200., 250., 300., 400., 500., 600., 700., 800., 900.,
+              1000., 1100., 1200., 1300., 1400., 1500., 1750., 2000.,
+              2500., 3000., 3500., 4000., 4500., 5000., 5500., 6000.,
+              6500., 7000., 7500., 8000., 8500., 9000.]
+
+# Variable codes (Table 3) 1..43 -> names, as in wod_rd.m
+STD_NAMES = ['temp', 'sal', 'ox', 'po4', 'Tpo4', 'si', 'no2', 'no3', 'pH', 'nh4',
+             'chl', 'phaeo', 'pprod', 'biochem', 'lightc14', 'darkc14', 'alk',
+             'POC', 'DOC', 'pco2', 'dic', 'xco2sea', 'no2no3', 'xmiss', 'press', 'air_temp',
+             'co2warm', 'xco2_atm', 'air_press', 'lat', 'lon', 'julday', 'tritium', 'helium',
+             'deltaHe', 'deltaC14', 'deltaC13', 'Ar', 'Ne', 'cfc11', 'cfc12', 'cfc113', 'o18']
+
+
+def read_int(ichar, ptr, length=None):
+    # Without a length the first character gives the number of digits that follow
+    if length is None:
+        field_bytes = int(ichar[ptr])
+        val = int(ichar[ptr + 1:ptr + 1 + field_bytes]) if field_bytes > 0 else 0
+        return val, ptr + field_bytes + 1
+
+    field = ichar[ptr:ptr + length].strip()
+    return (int(field) if field else 0), ptr + length
+
+
+def read_float(ichar, ptr):
+    # '-' marks a missing value, otherwise <sig digits><total digits><precision><digits>
+    if ichar[ptr] == '-':
+        return np.nan, ptr + 1
+
+    tot = int(ichar[ptr + 1])
+    prec = int(ichar[ptr + 2])
+    val = int(ichar[ptr + 3:ptr + 3 + tot]) / 10**prec
+    return val, ptr + tot + 3
+
+
+def read_profile(ichar, fmt):
+    _, ptr = read_int(ichar, 0)  # bytes in profile
+    station, ptr = read_int(ichar, ptr)
+    if fmt in ['A', 'B']:
+        country, ptr = read_int(ichar, ptr, 2)
+    else:
+        country = ichar[ptr:ptr + 2]
+        ptr += 2
+    cruise, ptr = read_int(ichar, ptr)
+    year, ptr = read_int(ichar, ptr, 4)
+    mon, ptr = read_int(ichar, ptr, 2)
+    dy, ptr = read_int(ichar, ptr, 2)
+    tim, ptr = read_float(ichar, ptr)  # decimal hours
+    lat, ptr = read_float(ichar, ptr)
+    lon, ptr = read_float(ichar, ptr)
+
+    prof_time = dt.datetime(year, max(mon, 1), max(dy, 1))
+    if np.isfinite(tim): prof_time += dt.timedelta(hours=tim)
+
+    nlevels, ptr = read_int(ichar, ptr)
+    isoor, ptr = read_int(ichar, ptr, 1)
+    nvar, ptr = read_int(ichar, ptr, 2)
+
+    # Variable metadata - only the variable codes are kept
+    var_codes = []
+    for _ in range(nvar):
+        var_code, ptr = read_int(ichar, ptr)
+        var_codes.append(var_code)
+        _, ptr = read_int(ichar, ptr, 1)  # QC flag
+        nmeta, ptr = read_int(ichar, ptr)
+        for _ in range(nmeta):
+            _, ptr = read_int(ichar, ptr)
+            _, ptr = read_float(ichar, ptr)
+
+    # Character data / PI block
+    nbyte, ptr = read_int(ichar, ptr)
+    if nbyte > 0:
+        nentry, ptr = read_int(ichar, ptr, 1)
+        for _ in range(nentry):
+            ctype, ptr = read_int(ichar, ptr, 1)
+            if ctype < 3:
+                # Originator's cruise (1) or station (2) code
+                ndat, ptr = read_int(ichar, ptr, 2)
+                ptr += ndat
+            else:
+                # PI names
+                ndat, ptr = read_int(ichar, ptr, 2)
+                for _ in range(ndat):
+                    _, ptr = read_int(ichar, ptr)
+                    _, ptr = read_int(ichar, ptr)
+
+    # Secondary header
+    platform = np.nan
+    institution = np.nan
+    bottom_depth = np.nan
+    nbyte, ptr = read_int(ichar, ptr)
+    if nbyte > 0:
+        nentry, ptr = read_int(ichar, ptr)
+        for _ in range(nentry):
+            var_code, ptr = read_int(ichar, ptr)
+            head_val, ptr = read_float(ichar, ptr)
+            if var_code == 3:
+                platform = head_val
+            elif var_code == 4:
+                institution = head_val
+            elif var_code == 10:
+                bottom_depth = head_val
+
+    # Biological header & taxonomic data - skipped
+    nbyte, ptr = read_int(ichar, ptr)
+    if nbyte > 0:
+        nentry, ptr = read_int(ichar, ptr)
+        for _ in range(nentry):
+            _, ptr = read_int(ichar, ptr)
+            _, ptr = read_float(ichar, ptr)
+        ntaxa, ptr = read_int(ichar, ptr)
+        for _ in range(ntaxa):
+            nentry, ptr = read_int(ichar, ptr)
+            for _ in range(nentry):
+                _, ptr = read_int(ichar, ptr)
+                _, ptr = read_float(ichar, ptr)
+                _, ptr = read_int(ichar, ptr, 2)
+
+    depths = np.full(nlevels, np.nan)
+    vals = np.full((nvar, nlevels), np.nan)
+    for l in range(nlevels):
+        if isoor == 0 or fmt == 'C':
+            depths[l], ptr = read_float(ichar, ptr)
+        else:
+            depths[l] = STD_DEPTHS[l]
+        ptr += 2  # depth error flag & originator's depth error flag
+
+        for m in range(nvar):
+            vals[m, l], ptr = read_float(ichar, ptr)
+            if np.isfinite(vals[m, l]): ptr += 2  # QC flag & originator's flag
+
+    profile = {
+        'station': station,
+        'country': country,
+        'cruise': cruise,
+        'time': prof_time,
+        'latitude': lat,
+        'longitude': lon,
+        'platform': platform,
+        'institution': institution,
+        'bottom_depth': bottom_depth,
+        'depth': depths
+    }
+    for m, var_code in enumerate(var_codes):
+        if 0 < var_code <= len(STD_NAMES):
+            profile[STD_NAMES[var_code - 1]] = vals[m]
+
+    return profile
+
+
+def wod_rd(fname):
+    """
+    Read every profile in a WOD file. Returns a list of dicts with header
+    fields, 'depth' (m) and one array per measured variable named as in
+    STD_NAMES (e.g. 'temp' C, 'sal' PSU). 'ox' is ml/l in WOD13 and earlier
+    releases but umol/kg from WOD18 on - the file format doesn't say which.
+    """
+    with open(fname, 'r') as f:
+        dat = f.read().replace('\n', '').replace('\r', '')
+
+    fmt = dat[0]
+    if fmt not in ['A', 'B', 'C']:
+        raise ValueError('Unsupported WOD format (WOD 1998?): {}'.format(fname))
+
+    # Profiles always start at the beginning of an 80 character line, with
+    # the format character followed by a digit
+    prof_starts = [i for i in range(0, len(dat), 80)
+                   if dat[i] == fmt and dat[i + 1:i + 2].isdigit()]
+    prof_starts.append(len(dat))
+
+    profiles = []
+    for start, end in zip(prof_starts[:-1], prof_starts[1:]):
+        profiles.append(read_profile(dat[start + 1:end], fmt))
+
+    return profiles